@@ -0,0 +1,42 @@
+"""Module with helpers shared by the address lookups."""
+
+import pandas as pd
+
+# Coordinate columns added to addresses, in output order.
+COORDINATE_COLUMNS = ["longitude", "latitude", "amersfoort_x", "amersfoort_y"]
+
+
+def assign_coordinates(
+    addresses: pd.DataFrame, columns: list, coordinates: dict
+) -> pd.DataFrame:
+    """Assign coordinates found for unique addresses to all addresses.
+
+    Parameters
+    ----------
+    addresses : pandas.DataFrame
+        DataFrame with all addresses, including duplicates.
+    columns : list
+        Address columns used to determine unique addresses.
+    coordinates : dict
+        Dict mapping each of `COORDINATE_COLUMNS` to an array with coordinates
+        for each unique address.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Addresses DataFrame including the coordinate columns.
+
+    Notes
+    -----
+    The coordinate arrays must be in the order of
+    ``addresses[columns].drop_duplicates()``.
+    """
+    # Number addresses by the first occurrence of their unique values.
+    codes = (
+        addresses.groupby(columns, dropna=False, sort=False)
+        .ngroup()
+        .to_numpy(dtype=int)
+    )
+    return addresses.assign(
+        **{column: coordinates[column][codes] for column in COORDINATE_COLUMNS}
+    )
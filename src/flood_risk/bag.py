@@ -2,12 +2,66 @@
 
 import logging
 import os
-import re
+import queue
 import sqlite3
-from typing import Any, Union
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 from pyproj import Transformer
+from flood_risk.addresses import assign_coordinates
+
+# Minimum number of addresses per batch when spreading work over connections.
+MIN_BATCH_SIZE = 1000
+
+# Static SQL for batched lookups, reused as-is so connections can cache the
+# prepared statements. The temporary table is discarded by a rollback.
+CREATE_LOOKUP_TABLE = """
+    CREATE TEMP TABLE lookup_address (
+        row_id INTEGER PRIMARY KEY,
+        postcode TEXT,
+        huisnummer INTEGER,
+        huisletter TEXT,
+        toevoeging TEXT
+    )
+"""
+INSERT_LOOKUP_ROWS = "INSERT INTO lookup_address VALUES (?, ?, ?, ?, ?)"
+
+# Keep a single match per address, preferring units without a letter or suffix
+# when the address has none, then the first unit in the BAG data. Bounds are
+# fetched from the R-Tree by its primary key, which is a direct rowid lookup.
+SELECT_LOOKUP_BOUNDS = """
+    SELECT
+        row_id, minx, maxx, miny, maxy
+    FROM (
+        SELECT
+            la.row_id, minx, maxx, miny, maxy,
+            ROW_NUMBER() OVER (
+                PARTITION BY la.row_id
+                ORDER BY
+                    la.huisletter IS NULL AND vo.huisletter IS NOT NULL,
+                    la.toevoeging IS NULL AND vo.toevoeging IS NOT NULL,
+                    vo.rowid
+            ) AS match_rank
+        FROM lookup_address la
+        JOIN verblijfsobject vo
+            ON vo.postcode = la.postcode
+            AND vo.huisnummer = la.huisnummer
+            AND (la.huisletter IS NULL OR UPPER(vo.huisletter) = la.huisletter)
+            AND (la.toevoeging IS NULL OR UPPER(vo.toevoeging) = la.toevoeging)
+        JOIN rtree_verblijfsobject_geom rvo
+            ON rvo.id = vo.feature_id
+    )
+    WHERE match_rank = 1
+"""
+
+# Index for finding addresses, the BAG data does not provide one.
+ADDRESS_INDEX = "idx_verblijfsobject_address"
+CREATE_ADDRESS_INDEX = f"""
+    CREATE INDEX IF NOT EXISTS {ADDRESS_INDEX}
+    ON verblijfsobject (postcode, huisnummer, huisletter, toevoeging)
+"""
 
 
 class BAGLookup:
@@ -17,12 +71,31 @@ class BAGLookup:
     ----------
     bag_path : str
         Path to the BAG geopackage file.
+    workers : int, default=4
+        Number of database connections used for parallel lookups.
     """
 
-    def __init__(self, bag_path: str) -> None:
+    def __init__(self, bag_path: str, workers: int = 4) -> None:
         self._log = logging.getLogger(self.__class__.__name__)
-        self._transformer = Transformer.from_crs("EPSG:28992", "EPSG:4326")
-        self._database = self._connect(bag_path)
+        self._transformer = Transformer.from_crs(
+            "EPSG:28992", "EPSG:4326", always_xy=True
+        )
+        self._workers = max(1, workers)
+
+        # Must be an existing database, do not create one.
+        if not os.path.isfile(bag_path):
+            raise RuntimeError(f"BAG data not found at: {bag_path}")
+
+        self._bag_path = bag_path
+        self._pool = queue.Queue()
+        for _ in range(self._workers):
+            self._pool.put(self._connect(bag_path))
+
+        if not self._has_index():
+            self._log.warning(
+                "BAG data has no address index, lookups will be slow. "
+                "Use --index-bag (or create_index) once to add it."
+            )
 
     def lookup(self, addresses: pd.DataFrame) -> pd.DataFrame:
         """Look up GPS coordinates for a DataFrame with addresses.
@@ -49,17 +122,82 @@ class BAGLookup:
 
         # Format postcode and uppercase address components.
         addresses = addresses.assign(
-            postcode=lambda df: df["postcode"].map(self._format_pc6),
-            house_letter=lambda df: df["house_letter"].map(self._make_upper),
-            house_suffix=lambda df: df["house_suffix"].map(self._make_upper),
+            postcode=lambda df: df["postcode"].str.replace(
+                r"(\d{4})\s*(\w{2})", r"\1\2", regex=True
+            ),
+            house_letter=lambda df: self._make_upper(df["house_letter"]),
+            house_suffix=lambda df: self._make_upper(df["house_suffix"]),
         )
 
-        coordinates = addresses[required].apply(self._lookup_address, axis=1)
-        return addresses.join(pd.json_normalize(coordinates))
+        # Look up unique addresses only, missing addresses get NaN bounds.
+        unique = addresses[required].drop_duplicates()
+        bounds = self._lookup_bounds(unique)
+        for address in unique[np.isnan(bounds[:, 0])].to_dict("records"):
+            self._log.warning(
+                "No location found for: %s", self._format_address(address)
+            )
+
+        # Compute centroids and convert all coordinates in one go.
+        loc_x = (bounds[:, 0] + bounds[:, 1]) / 2
+        loc_y = (bounds[:, 2] + bounds[:, 3]) / 2
+        gps_lat = np.full(len(unique), np.nan)
+        gps_lon = np.full(len(unique), np.nan)
+        found = ~np.isnan(loc_x)
+        if found.any():
+            gps_lon[found], gps_lat[found] = self._transformer.transform(
+                loc_x[found], loc_y[found]
+            )
+
+        # Map results for unique addresses back to all addresses.
+        return assign_coordinates(
+            addresses,
+            required,
+            {
+                "amersfoort_x": loc_x,
+                "amersfoort_y": loc_y,
+                "longitude": gps_lon,
+                "latitude": gps_lat,
+            },
+        )
+
+    def create_index(self) -> None:
+        """Add the address index to the BAG data file.
+
+        This changes the BAG file and may take a while, but only needs to be
+        done once. Afterwards addresses are found with an index search instead
+        of a full table scan.
+        """
+        if self._has_index():
+            self._log.info("BAG data already has an address index.")
+            return
+
+        self._log.info("Creating address index on BAG data, this may take a while.")
+        try:
+            connection = sqlite3.connect(
+                Path(self._bag_path).resolve().as_uri() + "?mode=rw", uri=True
+            )
+            try:
+                with connection:
+                    connection.execute(CREATE_ADDRESS_INDEX)
+            finally:
+                connection.close()
+        except sqlite3.OperationalError as error:
+            raise RuntimeError(
+                f"Could not create address index on BAG data: {error}"
+            ) from error
+
+        # Immutable lookup connections do not notice schema changes, reopen them.
+        for _ in range(self._workers):
+            self._pool.get().close()
+        for _ in range(self._workers):
+            self._pool.put(self._connect(self._bag_path))
 
     def _connect(self, bag_path):
         """Connect to the BAG data file.
 
+        The connection is read-only and treats the file as immutable, so SQLite
+        skips all file locking. Transactions are managed explicitly.
+
         Parameters
         ----------
         bag_path : str
@@ -72,94 +210,123 @@ class BAGLookup:
             SQLite3 database connection.
         """
         self._log.debug("Connecting to BAG data: %s", bag_path)
-        # Must be an existing database, do not create one.
-        if not os.path.isfile(bag_path):
-            raise RuntimeError(f"BAG data not found at: {bag_path}")
-
         try:
-            return sqlite3.connect(bag_path)
+            connection = sqlite3.connect(
+                Path(bag_path).resolve().as_uri() + "?mode=ro&immutable=1",
+                uri=True,
+                isolation_level=None,
+                cached_statements=256,
+                check_same_thread=False,
+            )
+
+            # Tune for read-heavy use: large page cache, memory mapped I/O
+            # and temporary tables kept in memory.
+            connection.execute("PRAGMA cache_size = -200000")
+            connection.execute("PRAGMA mmap_size = 1073741824")
+            connection.execute("PRAGMA temp_store = MEMORY")
+            return connection
         except sqlite3.OperationalError as error:
             raise RuntimeError(f"Could not open BAG data from: {bag_path}") from error
 
+    def _has_index(self) -> bool:
+        """Check whether the BAG data has the address index."""
+        connection = self._pool.get()
+        try:
+            return (
+                connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                    (ADDRESS_INDEX,),
+                ).fetchone()
+                is not None
+            )
+        except sqlite3.OperationalError as error:
+            raise RuntimeError(f"Failed to query BAG data: {error}") from error
+        finally:
+            self._pool.put(connection)
+
     @staticmethod
-    def _make_upper(value: Any) -> Any:
+    def _make_upper(values: pd.Series) -> pd.Series:
         """Uppercase strings leaving other types as-is."""
-        return value.upper() if hasattr(value, "upper") else value
+        if not pd.api.types.is_string_dtype(values.dtype):
+            return values
+        return values.str.upper().fillna(values)
 
     @staticmethod
-    def _format_address(address: pd.Series) -> str:
+    def _format_address(address: dict) -> str:
         """Format addresses."""
         output = f"{address['postcode']}, {address['house_number']}"
         if pd.notna(address["house_letter"]):
             output += str(address["house_letter"])
         if pd.notna(address["house_suffix"]):
-            output += " " + address["house_suffix"]
+            output += " " + str(address["house_suffix"])
         return output
 
-    @staticmethod
-    def _format_pc6(postcode: str) -> str:
-        """Format postcodes as 4 digits 2 letters without a space."""
-        return re.sub(r"(\d{4})\s*(\w{2})", r"\1\2", postcode)
-
-    def _lookup_address(self, address: pd.Series) -> Union[dict, None]:
-        """Look up a single address.
+    def _lookup_bounds(self, addresses: pd.DataFrame) -> np.ndarray:
+        """Look up bounds for all addresses using parallel batches.
 
         Parameters
         ----------
-        address : pd.Series
-            Address row including postcode and house number.
+        addresses : pd.DataFrame
+            Addresses including postcode, house number, letter and suffix.
 
         Returns
         -------
-        dict or None
-            Dict containing GPS and Amersfoort coordinates.
-            None is returned if no location was found.
-        """
-        address_str = self._format_address(address)
-        self._log.debug("Looking up address: %s", address_str)
-
-        params = ["postcode", "house_number"]
-        query = """
-            SELECT
-                minx, maxx, miny, maxy
-            FROM verblijfsobject vo
-            LEFT JOIN rtree_verblijfsobject_geom rvo
-                ON vo.feature_id = rvo.id
-            WHERE
-                postcode = ?
-                AND huisnummer = ?
+        np.ndarray
+            Array with Amersfoort bounds (minx, maxx, miny, maxy) per address.
+            Bounds are NaN for addresses without a location.
         """
-        if pd.notna(address["house_letter"]):
-            params.append("house_letter")
-            query += " AND UPPER(huisletter) = ?"
+        n_batches = max(1, min(self._workers, len(addresses) // MIN_BATCH_SIZE))
+        self._log.debug(
+            "Looking up %d addresses in %d batches.", len(addresses), n_batches
+        )
 
-        if pd.notna(address["house_suffix"]):
-            params.append("house_suffix")
-            query += " AND UPPER(toevoeging) = ?"
+        batches = [
+            addresses.iloc[positions]
+            for positions in np.array_split(np.arange(len(addresses)), n_batches)
+        ]
+        with ThreadPoolExecutor(max_workers=n_batches) as executor:
+            return np.concatenate(list(executor.map(self._query_bounds, batches)))
+
+    def _query_bounds(self, addresses: pd.DataFrame) -> np.ndarray:
+        """Look up bounds for a batch of addresses in a single query.
+
+        The addresses are loaded into a temporary table which is then joined
+        against the BAG data, avoiding a separate query for each address.
+
+        Parameters
+        ----------
+        addresses : pd.DataFrame
+            Addresses including postcode, house number, letter and suffix.
+
+        Returns
+        -------
+        np.ndarray
+            Array with Amersfoort bounds (minx, maxx, miny, maxy) per address.
+            Bounds are NaN for addresses without a location.
+        """
+        # Use Python objects and None for missing values to bind parameters.
+        columns = [
+            addresses[column].astype(object).where(addresses[column].notna(), None)
+            for column in addresses.columns
+        ]
+        rows = zip(range(len(addresses)), *columns)
 
+        connection = self._pool.get()
         try:
-            result = self._database.execute(query, list(address[params]))
+            connection.execute("BEGIN")
+            try:
+                connection.execute(CREATE_LOOKUP_TABLE)
+                connection.executemany(INSERT_LOOKUP_ROWS, rows)
+                result = connection.execute(SELECT_LOOKUP_BOUNDS).fetchall()
+            finally:
+                connection.execute("ROLLBACK")
         except sqlite3.OperationalError as error:
             raise RuntimeError(f"Failed to query BAG data: {error}") from error
+        finally:
+            self._pool.put(connection)
 
-        location = result.fetchone()
-        if not location:
-            self._log.warning("No location found for: %s", address_str)
-            return None
-
-        # Add and convert coordinates.
-        fields = [field[0] for field in result.description]
-        location = dict(zip(fields, location))
-
-        # Compute and convert coordinates.
-        loc_x = (location["minx"] + location["maxx"]) / 2
-        loc_y = (location["miny"] + location["maxy"]) / 2
-        # pylint: disable=unpacking-non-sequence
-        gps_lat, gps_lon = self._transformer.transform(loc_x, loc_y)
-
-        return {
-            "longitude": gps_lon,
-            "latitude": gps_lat,
-            "amersfoort_x": loc_x,
-            "amersfoort_y": loc_y,
-        }
+        bounds = np.full((len(addresses), 4), np.nan)
+        if result:
+            result = np.array(result, dtype=float)
+            bounds[result[:, 0].astype(int)] = result[:, 1:]
+        return bounds
@@ -3,6 +3,7 @@
 import argparse
 import logging
 import sys
+from typing import Iterator
 
 import pandas as pd
 from flood_risk.bag import BAGLookup
@@ -69,6 +70,31 @@ def parse_args() -> argparse.Namespace:
         default="bag_data/bag-light.gpkg",
         required=False,
     )
+    parser.add_argument(
+        "-i",
+        "--index-bag",
+        dest="index_bag",
+        action="store_true",
+        help="Add an address index to the BAG data file, only needed once.",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        dest="cache_path",
+        type=str,
+        help="Path to the Nominatim geocoding cache file.",
+        default=".nominatim_cache.sqlite",
+        required=False,
+    )
+    parser.add_argument(
+        "-s",
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        help="Number of addresses to process at a time.",
+        default=10_000,
+        required=False,
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -80,23 +106,34 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def load_addresses(address_file: str) -> pd.DataFrame:
-    """Loads addresses from CSV.
+def load_addresses(address_file: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Loads addresses from CSV in chunks.
 
     Parameters
     ----------
     address_file : str
         Path to the CSV file with addresses to look up.
+    chunksize : int
+        Number of addresses per chunk.
 
-    Returns
-    -------
+    Yields
+    ------
     pandas.DataFrame
-        DataFrame with address data.
+        DataFrame with a chunk of address data.
     """
     logger.info("Reading addresses from: %s", address_file)
 
     try:
-        addresses = pd.read_csv(address_file)
+        # Fix text column types, otherwise they are inferred for each chunk.
+        text_columns = ["street", "postcode", "house_letter", "house_suffix"]
+        with pd.read_csv(
+            address_file,
+            chunksize=chunksize,
+            dtype={column: str for column in text_columns},
+        ) as reader:
+            for addresses in reader:
+                logger.info("Read %d addresses.", len(addresses))
+                yield addresses
 
     except FileNotFoundError:
         logger.error("Cannot find address CSV file: %s.", address_file)
@@ -107,9 +144,6 @@ def load_addresses(address_file: str) -> pd.DataFrame:
         logger.error("Error reading address CSV file: %s.", error)
         sys.exit(1)
 
-    logger.info("Found %d addresses.", len(addresses))
-    return addresses
-
 
 def main() -> None:
     """Main program routine."""
@@ -119,32 +153,44 @@ def main() -> None:
     logger.setLevel(args.verbose.upper())
     logger.info("Starting flooding risk lookup.")
 
-    # Load addresses and find risk files.
-    addresses = load_addresses(args.address_file)
+    # Set up geographical location lookup.
+    try:
+        if args.method == "bag":
+            logger.info("Using geolocation method: BAG.")
+            locator = BAGLookup(args.bag_path)
+            if args.index_bag:
+                locator.create_index()
+        else:
+            logger.info("Using geolocation method: Nominatim.")
+            locator = NominatimLookup(args.cache_path)
+    except RuntimeError as error:
+        logger.error("Geolocating error: %s.", error)
+        sys.exit(1)
+
+    risk = RiskLookup(args.risk_path)
 
-    # Look up geoghraphical locations for addresses.
-    if args.method == "bag":
-        logger.info("Using geolocation method: BAG.")
+    # Process addresses in chunks, appending output after the first chunk.
+    logger.info("Writing flooding risk output to: %s.", args.output_file)
+    chunks = load_addresses(args.address_file, args.chunksize)
+    for chunk_number, addresses in enumerate(chunks):
         try:
-            bag = BAGLookup(args.bag_path)
-            locations = bag.lookup(addresses)
+            locations = locator.lookup(addresses)
         except RuntimeError as error:
             logger.error("Geolocating error: %s.", error)
             sys.exit(1)
 
-    else:
-        logger.info("Using geolocation method: Nominatim.")
-        nominatim = NominatimLookup()
-        locations = nominatim.lookup(addresses)
+        # Add risk indicators.
+        risk_data = risk.lookup(locations)
 
-    # Add risk indicators.
-    risk = RiskLookup(args.risk_path)
-    risk_data = risk.lookup(locations)
-
-    # Store output
-    logger.info("Writing flooding risk output to: %s.", args.output_file)
-    risk_data.to_csv(args.output_file, index=False)
+        # Store output
+        risk_data.to_csv(
+            args.output_file,
+            mode="w" if chunk_number == 0 else "a",
+            header=chunk_number == 0,
+            index=False,
+        )
 
+    risk.close()
     logger.info("Finished looking up flooding risks!")
 
 
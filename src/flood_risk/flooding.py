@@ -1,10 +1,13 @@
 """Module for looking up flooding risk using GPS coordinates."""
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Union
 
+import numpy as np
 import pandas as pd
-import xarray as xr
+import rasterio
 
 
 class RiskLookup:
@@ -19,6 +22,11 @@ class RiskLookup:
     def __init__(self, data_path) -> None:
         self._log = logging.getLogger(self.__class__.__name__)
         self._path = data_path
+        self._raster_cache = {}
+
+    def close(self) -> None:
+        """Release cached raster data."""
+        self._raster_cache.clear()
 
     def _find_risk_files(self, risk_data: str) -> list:
         """Find TIF risk files in the specfied folder.
@@ -63,51 +71,82 @@ class RiskLookup:
         if missing:
             self._log.error("Missing coordinate columns: %s", ", ".join(missing))
 
-        # Create Series of tuples for coordinates.
-        coordinates = data.apply(
-            lambda row: (row["amersfoort_x"], row["amersfoort_y"]), axis=1
-        )
+        # Get coordinate arrays.
+        x = data["amersfoort_x"].to_numpy(dtype=float)
+        y = data["amersfoort_y"].to_numpy(dtype=float)
 
-        # Assign risk scores.
-        assignments = {}
+        # Map output columns to risk files.
+        jobs = {}
         risk_files = self._find_risk_files(self._path)
         for risk_file in risk_files:
-            self._log.debug("Processing flooding risks from: %s", risk_file)
             risk_file = Path(risk_file)
             column_name = risk_file.name[:-4].lower().replace(" ", "_")
-
-            risk_scores = self._lookup_risks(coordinates, risk_file)
-            if risk_scores is not None:
-                assignments[column_name] = risk_scores
+            jobs[column_name] = risk_file
+
+        if not jobs:
+            return data
+
+        # Look up risk scores from all risk files in parallel.
+        with ThreadPoolExecutor(max_workers=min(8, len(jobs))) as executor:
+            results = executor.map(
+                lambda risk_file: self._lookup_risks(x, y, risk_file),
+                jobs.values(),
+            )
+            assignments = {
+                column_name: risk_scores
+                for column_name, risk_scores in zip(jobs, results)
+                if risk_scores is not None
+            }
 
         return data.assign(**assignments)
 
-    def _lookup_risks(self, coordinates: pd.Series, risk_file: Path) -> pd.Series:
-        """Look up risks for a Series of Amersfoort coordinates.
+    def _lookup_risks(
+        self, x: np.ndarray, y: np.ndarray, risk_file: Path
+    ) -> Union[np.ndarray, None]:
+        """Look up risks for arrays of Amersfoort coordinates.
 
         Parameters
         ----------
-        coordinates : pd.Series
-            Series of Amersfoort coordinate tuples.
+        x : np.ndarray
+            Array of Amersfoort x coordinates.
+        y : np.ndarray
+            Array of Amersfoort y coordinates.
         risk_file : pathlib.Path
             Path to the TIF risk data file.
 
         Returns
         -------
-        pd.Series
-            Series of risk scores for the provided GPS coordinates.
+        np.ndarray or None
+            Array of risk scores for the provided coordinates.
+            None is returned if the risk data could not be read.
         """
-        self._log.info("Reading risk data from: %s", risk_file)
-        try:
-            risk_data = xr.open_dataset(risk_file, engine="rasterio")
-
-        # pylint: disable=broad-exception-caught.
-        except Exception as error:
-            self._log.warning("Error reading risk data: %s", error)
-            return None
-
-        return coordinates.map(
-            lambda coords: risk_data.sel(
-                x=coords[0], y=coords[1], method="nearest"
-            ).band_data.values[0]
-        )
+        # Read each raster only once, reuse it for later lookups.
+        if risk_file not in self._raster_cache:
+            self._log.info("Reading risk data from: %s", risk_file)
+            try:
+                with rasterio.open(risk_file) as source:
+                    self._raster_cache[risk_file] = (
+                        source.read(1),
+                        source.nodata,
+                        ~source.transform,
+                    )
+
+            # pylint: disable=broad-exception-caught.
+            except Exception as error:
+                self._log.warning("Error reading risk data: %s", error)
+                return None
+
+        band, nodata, inverse = self._raster_cache[risk_file]
+
+        # Convert coordinates to pixel indices, clipping to the raster edges.
+        cols, rows = inverse * (x, y)
+        valid = ~(np.isnan(cols) | np.isnan(rows))
+        cols = np.clip(np.floor(cols[valid]).astype(int), 0, band.shape[1] - 1)
+        rows = np.clip(np.floor(rows[valid]).astype(int), 0, band.shape[0] - 1)
+
+        # Only convert sampled values, masking no data as NaN like xarray.
+        risk_scores = np.full(len(x), np.nan)
+        risk_scores[valid] = band[rows, cols]
+        if nodata is not None:
+            risk_scores[risk_scores == nodata] = np.nan
+        return risk_scores
@@ -1,22 +1,36 @@
 """Module for looking up GPS coordinates for addresses using Nominatim."""
 
+import asyncio
 import logging
-import re
-import time
-from typing import Union
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Union
 
+import numpy as np
 import pandas as pd
+from geopy.adapters import AioHTTPAdapter
+from geopy.exc import GeocoderServiceError
+from geopy.extra.rate_limiter import AsyncRateLimiter
 from geopy.geocoders import Nominatim
 from pyproj import Transformer
+from flood_risk.addresses import assign_coordinates
 
 
 class NominatimLookup:
-    """Class for looking up addresses using Nominatim."""
+    """Class for looking up addresses using Nominatim.
 
-    def __init__(self) -> None:
+    Parameters
+    ----------
+    cache_path : str, default=".nominatim_cache.sqlite"
+        Path to the SQLite file for caching geocoding results.
+    """
+
+    def __init__(self, cache_path: str = ".nominatim_cache.sqlite") -> None:
         self._log = logging.getLogger(self.__class__.__name__)
-        self._locator = Nominatim(user_agent="TestGeocoder")
-        self._transformer = Transformer.from_crs("EPSG:4326", "EPSG:28992")
+        self._transformer = Transformer.from_crs(
+            "EPSG:4326", "EPSG:28992", always_xy=True
+        )
+        self._cache = self._connect(cache_path)
 
     def lookup(self, addresses: pd.DataFrame) -> pd.DataFrame:
         """Look up GPS coordinates for a DataFrame with addresses.
@@ -50,59 +64,235 @@ class NominatimLookup:
 
         # Format postcodes as 4 digits <space> 2 letters.
         addresses = addresses.assign(
-            postcode=lambda df: df["postcode"].map(self._format_pc6),
+            postcode=lambda df: df["postcode"].str.replace(
+                r"(\d{4})\s*(\w{2})", r"\1 \2", regex=True
+            ),
         )
 
-        coordinates = addresses.apply(self._lookup_address, axis=1)
-        return addresses.join(pd.json_normalize(coordinates))
+        # Look up unique addresses only, missing addresses get NaN coordinates.
+        unique = addresses[required].drop_duplicates()
+        gps_lat = np.full(len(unique), np.nan)
+        gps_lon = np.full(len(unique), np.nan)
+        locations = self._run(self._lookup_addresses(unique))
+        for position, location in enumerate(locations):
+            if location is not None:
+                gps_lat[position], gps_lon[position] = location
 
-    def _lookup_address(self, address: pd.Series) -> Union[dict, None]:
-        """Look up GPS coordinates for an address.
+        # Convert all coordinates to Amersfoort in one go.
+        loc_x = np.full(len(unique), np.nan)
+        loc_y = np.full(len(unique), np.nan)
+        found = ~np.isnan(gps_lat)
+        if found.any():
+            loc_x[found], loc_y[found] = self._transformer.transform(
+                gps_lon[found], gps_lat[found]
+            )
+
+        # Map results for unique addresses back to all addresses.
+        return assign_coordinates(
+            addresses,
+            required,
+            {
+                "longitude": gps_lon,
+                "latitude": gps_lat,
+                "amersfoort_x": loc_x,
+                "amersfoort_y": loc_y,
+            },
+        )
+
+    def _connect(self, cache_path: str) -> sqlite3.Connection:
+        """Connect to the geocoding cache, creating it if needed.
 
         Parameters
         ----------
-        address : pd.Series
-            Address row including street, postcode and house number.
+        cache_path : str
+            Path to the SQLite cache file.
 
         Returns
         -------
-        dict or None
-            Dict containing GPS and Amersfoort coordinates.
-            None is returned if no location was found.
+        sqlite3.Connection
+            SQLite3 database connection.
         """
-        street = self._format_street(address)
-        self._log.debug("Looking up address: %s, %s", street, address["postcode"])
-        location = self._locator.geocode(
-            {
-                "street": street,
-                "postalcode": address["postcode"],
-                "country": "Nederland",
-            },
-            exactly_one=True,
-        )
+        self._log.debug("Connecting to geocoding cache: %s", cache_path)
+        try:
+            # Lookups may run on a worker thread, see `_run`.
+            cache = sqlite3.connect(cache_path, check_same_thread=False)
+            cache.execute(
+                """
+                CREATE TABLE IF NOT EXISTS geocode (
+                    query TEXT PRIMARY KEY,
+                    latitude REAL,
+                    longitude REAL
+                )
+                """
+            )
+            return cache
+        except sqlite3.Error as error:
+            raise RuntimeError(f"Could not open cache at: {cache_path}") from error
 
-        # Need to wait at least one second.
-        time.sleep(1)
+    @staticmethod
+    def _run(coroutine: Coroutine) -> Any:
+        """Run a coroutine to completion from synchronous code.
 
-        if not location:
-            self._log.warning(
-                "No location found for: %s, %s", street, address["postcode"]
+        If an event loop is already running (e.g. in Jupyter), the coroutine is
+        run in a new event loop on a worker thread instead.
+
+        Parameters
+        ----------
+        coroutine : Coroutine
+            Coroutine to run.
+
+        Returns
+        -------
+        Any
+            Result of the coroutine.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    def _read_cache(self, queries: list) -> dict:
+        """Read cached GPS coordinates for a list of queries.
+
+        Parameters
+        ----------
+        queries : list
+            List of formatted address queries.
+
+        Returns
+        -------
+        dict
+            Dict mapping cached queries to (latitude, longitude) tuples.
+        """
+        cached = {}
+        for query in queries:
+            location = self._cache.execute(
+                "SELECT latitude, longitude FROM geocode WHERE query = ?", (query,)
+            ).fetchone()
+            if location:
+                cached[query] = location
+        return cached
+
+    def _write_cache(self, locations: dict) -> None:
+        """Store GPS coordinates for queries in the cache.
+
+        Parameters
+        ----------
+        locations : dict
+            Dict mapping queries to (latitude, longitude) tuples.
+        """
+        with self._cache:
+            self._cache.executemany(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)",
+                ((query, *location) for query, location in locations.items()),
+            )
+
+    async def _lookup_addresses(self, addresses: pd.DataFrame) -> list:
+        """Look up GPS coordinates for all addresses concurrently.
+
+        Cached addresses are not sent to Nominatim. Other requests are started
+        at most once per second, as required by the Nominatim usage policy,
+        but may overlap while waiting for responses.
+
+        Parameters
+        ----------
+        addresses : pandas.DataFrame
+            DataFrame with addresses to look up.
+
+        Returns
+        -------
+        list
+            List with a (latitude, longitude) tuple or None for each address.
+        """
+        # Format streets and cache keys in a single pass over the addresses.
+        queries = []
+        for address in addresses.to_dict("records"):
+            street = self._format_street(address)
+            postcode = address["postcode"]
+            queries.append((f"{street}, {postcode}", street, postcode))
+
+        locations = self._read_cache([query for query, _, _ in queries])
+        self._log.info("Found %d addresses in cache.", len(locations))
+
+        uncached = [query for query in queries if query[0] not in locations]
+        if uncached:
+            async with Nominatim(
+                user_agent="TestGeocoder", adapter_factory=AioHTTPAdapter
+            ) as locator:
+                geocode = AsyncRateLimiter(
+                    locator.geocode, min_delay_seconds=1, swallow_exceptions=False
+                )
+                results = await asyncio.gather(
+                    *(
+                        self._lookup_address(geocode, query, street, postcode)
+                        for query, street, postcode in uncached
+                    )
+                )
+
+            locations.update(
+                (query, location)
+                for (query, _, _), location in zip(uncached, results)
+                if location is not None
             )
-            return None
 
-        # Get Amersfoort coordinates.
-        # pylint: disable=unpacking-non-sequence
-        x, y = self._transformer.transform(location.latitude, location.longitude)
+        return [locations.get(query) for query, _, _ in queries]
 
-        return {
-            "longitude": location.longitude,
-            "latitude": location.latitude,
-            "amersfoort_x": x,
-            "amersfoort_y": y,
-        }
+    async def _lookup_address(
+        self, geocode: Callable, query: str, street: str, postcode: str
+    ) -> Union[tuple, None]:
+        """Look up GPS coordinates for an address and cache found locations.
+
+        Parameters
+        ----------
+        geocode : Callable
+            Rate limited Nominatim geocode coroutine function.
+        query : str
+            Cache key for the address.
+        street : str
+            Street name including house number, letter and suffix.
+        postcode : str
+            Postcode formatted as 4 digits <space> 2 letters.
+
+        Returns
+        -------
+        tuple or None
+            Tuple with GPS coordinates (latitude, longitude).
+            None is returned if no location was found.
+
+        Raises
+        ------
+        RuntimeError
+            If Nominatim still fails after retrying.
+        """
+        self._log.debug("Looking up address: %s, %s", street, postcode)
+        try:
+            location = await geocode(
+                {
+                    "street": street,
+                    "postalcode": postcode,
+                    "country": "Nederland",
+                },
+                exactly_one=True,
+            )
+        except GeocoderServiceError as error:
+            raise RuntimeError(
+                f"Nominatim request failed for {street}, {postcode}: {error}"
+            ) from error
+
+        if not location:
+            self._log.warning("No location found for: %s, %s", street, postcode)
+            return None
+
+        # Cache right away so results survive an interrupted run, missing
+        # locations are not cached and will be retried next time.
+        self._write_cache({query: (location.latitude, location.longitude)})
+        return location.latitude, location.longitude
 
     @staticmethod
-    def _format_street(address: pd.Series) -> str:
+    def _format_street(address: dict) -> str:
         """Format street and house number wit optional components."""
         output = f"{address['street']} {address['house_number']}"
         if pd.notna(address["house_letter"]):
@@ -111,8 +301,3 @@ class NominatimLookup:
             output += " " + str(address["house_suffix"])
 
         return output
-
-    @staticmethod
-    def _format_pc6(postcode: str) -> str:
-        """Format postcode as 4 digits <space> 2 letters."""
-        return re.sub(r"(\d{4})\s*(\w{2})", r"\1 \2", postcode)